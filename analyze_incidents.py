@@ -1,19 +1,13 @@
-import configparser
 import pandas as pd
 from langchain_openai import OpenAI
 from langchain.chains import LLMChain
 from langchain.prompts import PromptTemplate
 from langchain.callbacks import get_openai_callback
-
-def load_config():
-    """Load OpenAI API key from config file"""
-    config = configparser.ConfigParser()
-    config.read('config.properties')
-    return config.get('DEFAULT', 'api_key')
+from app_config import load_config
 
 def setup_llm():
     """Initialize OpenAI LLM"""
-    api_key = load_config()
+    api_key = load_config()['api_key']
     return OpenAI(
         openai_api_key=api_key,
         model_name="gpt-3.5-turbo",
@@ -51,14 +45,14 @@ def create_incident_analysis_chain():
 
 def analyze_incidents(incident_file='Snow_Incidents.csv'):
     """Analyze IT support incidents using LangChain"""
-    # Read incidents data
-    df = pd.read_csv(incident_file)
+    # Read only the first row; the sample analysis never needs the rest of the file
+    first_chunk = pd.read_csv(incident_file, nrows=1)
     
     # Create analysis chain
     analysis_chain = create_incident_analysis_chain()
     
     # Analyze a sample incident (first one in this case)
-    sample_incident = df.iloc[0]
+    sample_incident = first_chunk.iloc[0]
     
     analysis = analysis_chain.run(
         incident_number=sample_incident['Number'],
@@ -1,163 +1,74 @@
 import os
+import re
 import json
+import queue
+import atexit
+import uuid
+import asyncio
+import hashlib
 import time
 import logging
 import logging.config
-import configparser
-from typing import List, Dict, Optional
+import logging.handlers
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime, timedelta
+import ahocorasick
+import diskcache
+import faiss
+import httpx
+import redis.asyncio as redis
+from aiolimiter import AsyncLimiter
+import numpy as np
 import pandas as pd
-from fastapi import FastAPI, Request
+import torch
+from cachetools import TTLCache
+from fastapi import FastAPI, Request, Response, BackgroundTasks
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse
 from pydantic import BaseModel
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain_openai import ChatOpenAI
+from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.callbacks.manager import get_openai_callback
-from langchain_community.vectorstores import Chroma
-from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
-from langchain.prompts import PromptTemplate
-from langchain.schema import Document
-
-# PII Protection imports
-from presidio_analyzer import AnalyzerEngine
-from presidio_anonymizer import AnonymizerEngine
-from presidio_anonymizer.entities import OperatorConfig
-
-# Import PII configuration
-try:
-    from pii_config import PII_ENTITIES, CONFIG
-except ImportError:
-    # Fallback configuration if pii_config.py is not available
-    PII_ENTITIES = ["PERSON", "EMAIL_ADDRESS", "PHONE_NUMBER", "CREDIT_CARD", "US_SSN", "IP_ADDRESS", "US_DRIVER_LICENSE"]
-    CONFIG = {"enabled": True, "excluded_entities": ["DATE_TIME"], "min_confidence": 0.6}
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain.chains import create_history_aware_retriever, create_retrieval_chain
+from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain_core.chat_history import InMemoryChatMessageHistory
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.embeddings import Embeddings
+
+from app_config import load_config
+from ingest import (
+    INCIDENT_FILE, CSV_CHUNK_SIZE, INCIDENT_COLUMNS, INCIDENT_DTYPES,
+    build_incident_documents, deduplicate_documents, get_pii_protector, init_worker_logging
+)
+
+def install_queue_logging(*loggers):
+    """Move each logger's configured handlers behind a QueueHandler drained on a background thread"""
+    for target in loggers:
+        handlers = target.handlers[:]
+        if not handlers:
+            continue
+        log_queue = queue.Queue(-1)
+        listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        for handler in handlers:
+            target.removeHandler(handler)
+        target.addHandler(logging.handlers.QueueHandler(log_queue))
+        listener.start()
+        atexit.register(listener.stop)
 
 # Setup logging
 os.makedirs('logs', exist_ok=True)
 logging.config.fileConfig('logging.conf')
 logger = logging.getLogger('chatbot')
-
-# PII Protection Configuration
-class PIIProtector:
-    """Handles PII detection and anonymization using Microsoft Presidio"""
-    
-    def __init__(self):
-        try:
-            # Initialize Presidio engines
-            self.analyzer = AnalyzerEngine()
-            self.anonymizer = AnonymizerEngine()
-            
-            # Use entities from configuration, excluding DATE_TIME for incident data
-            self.pii_entities = [entity for entity in PII_ENTITIES 
-                               if entity not in CONFIG.get("excluded_entities", [])]
-            
-            # Define anonymization operators
-            self.operators = {
-                "PERSON": OperatorConfig("replace", {"new_value": "[PERSON]"}),
-                "EMAIL_ADDRESS": OperatorConfig("replace", {"new_value": "[EMAIL]"}),
-                "PHONE_NUMBER": OperatorConfig("replace", {"new_value": "[PHONE]"}),
-                "CREDIT_CARD": OperatorConfig("replace", {"new_value": "[CREDIT_CARD]"}),
-                "US_SSN": OperatorConfig("replace", {"new_value": "[SSN]"}),
-                "IP_ADDRESS": OperatorConfig("replace", {"new_value": "[IP_ADDRESS]"}),
-                "LOCATION": OperatorConfig("replace", {"new_value": "[LOCATION]"}),
-                "ORGANIZATION": OperatorConfig("replace", {"new_value": "[ORGANIZATION]"}),
-                "US_DRIVER_LICENSE": OperatorConfig("replace", {"new_value": "[DRIVER_LICENSE]"}),
-            }
-            
-            self.enabled = CONFIG.get("enabled", True)
-            self.min_confidence = CONFIG.get("min_confidence", 0.6)
-            logger.info(f"PII Protection initialized - Entities: {self.pii_entities}")
-            
-        except ImportError as e:
-            logger.warning(f"Presidio not available: {e}. PII protection disabled.")
-            self.enabled = False
-        except Exception as e:
-            logger.error(f"Error initializing PII protection: {e}. PII protection disabled.")
-            self.enabled = False
-    
-    def analyze_text(self, text: str) -> List[Dict]:
-        """Analyze text for PII entities"""
-        if not self.enabled or not text:
-            return []
-        
-        try:
-            # Analyze text for PII
-            results = self.analyzer.analyze(
-                text=text,
-                entities=self.pii_entities,
-                language='en',
-                score_threshold=self.min_confidence
-            )
-            
-            # Convert to dictionary format for logging
-            pii_findings = []
-            for result in results:
-                pii_findings.append({
-                    'entity_type': result.entity_type,
-                    'confidence': result.score,
-                    'start': result.start,
-                    'end': result.end,
-                    'text': text[result.start:result.end]
-                })
-            
-            return pii_findings
-            
-        except Exception as e:
-            logger.error(f"Error analyzing text for PII: {e}")
-            return []
-    
-    def anonymize_text(self, text: str, log_findings: bool = True) -> str:
-        """Anonymize PII in text while preserving semantic meaning"""
-        if not self.enabled or not text:
-            return text
-        
-        try:
-            # First analyze for PII
-            pii_findings = self.analyze_text(text)
-            
-            # Log PII findings for compliance
-            if log_findings and pii_findings:
-                logger.info(f"PII detected in text: {len(pii_findings)} entities found")
-                for finding in pii_findings:
-                    logger.debug(f"PII Entity: {finding['entity_type']} (confidence: {finding['confidence']:.2f})")
-            
-            # Anonymize the text
-            analyzer_results = self.analyzer.analyze(
-                text=text,
-                entities=self.pii_entities,
-                language='en',
-                score_threshold=self.min_confidence
-            )
-            
-            anonymized_result = self.anonymizer.anonymize(
-                text=text,
-                analyzer_results=analyzer_results,
-                operators=self.operators
-            )
-            
-            return anonymized_result.text
-            
-        except Exception as e:
-            logger.error(f"Error anonymizing text: {e}")
-            return text  # Return original text if anonymization fails
-    
-    def get_pii_summary(self, text: str) -> Dict:
-        """Get summary of PII types found in text"""
-        if not self.enabled:
-            return {"enabled": False, "pii_count": 0, "types": []}
-        
-        findings = self.analyze_text(text)
-        pii_types = list(set([f['entity_type'] for f in findings]))
-        
-        return {
-            "enabled": True,
-            "pii_count": len(findings),
-            "types": pii_types,
-            "high_confidence_count": len([f for f in findings if f['confidence'] > 0.8])
-        }
+# Request handlers only enqueue records; file and console writes happen off the event loop
+install_queue_logging(logging.getLogger(), logger)
 
 # Initialize PII Protector
-pii_protector = PIIProtector()
+pii_protector = get_pii_protector()
 
 # Performance metrics class
 class QueryMetrics:
@@ -186,265 +97,580 @@ class QueryMetrics:
             "cost": f"${self.cost:.4f}"
         }
 
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that caches vectors on disk by SHA-256 of the text and memoizes queries in memory"""
+    
+    def __init__(self, embeddings: Embeddings, cache_dir: str, namespace: str = "",
+                 maxsize: int = 1024, ttl: int = 3600):
+        self.embeddings = embeddings
+        # Namespace keys by model so a model or dimension change never returns stale vectors
+        self.namespace = namespace
+        self.disk_cache = diskcache.Cache(cache_dir)
+        self.query_cache = TTLCache(maxsize=maxsize, ttl=ttl)
+    
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.namespace}\n{text}".encode()).hexdigest()
+    
+    def _lookup(self, texts: List[str]):
+        """Return cache keys, cached vectors (None for misses) and the positions of the misses"""
+        keys = [self._key(text) for text in texts]
+        # One SQLite transaction for the whole batch instead of one per text
+        with self.disk_cache.transact():
+            vectors = [self.disk_cache.get(key) for key in keys]
+        misses = [i for i, vector in enumerate(vectors) if vector is None]
+        return keys, vectors, misses
+    
+    def _merge(self, keys, vectors, misses, new_vectors) -> List[List[float]]:
+        """Store newly computed vectors as FP16 and return all vectors in input order"""
+        with self.disk_cache.transact():
+            for i, vector in zip(misses, new_vectors):
+                self.disk_cache.set(keys[i], np.asarray(vector, dtype='float16'))
+                vectors[i] = vector
+        return [
+            vector.astype('float32').tolist() if isinstance(vector, np.ndarray) else vector
+            for vector in vectors
+        ]
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors, misses = self._lookup(texts)
+        new_vectors = self.embeddings.embed_documents([texts[i] for i in misses]) if misses else []
+        return self._merge(keys, vectors, misses, new_vectors)
+    
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        # Disk cache reads and writes are blocking SQLite calls, so they run off the event loop
+        loop = asyncio.get_running_loop()
+        keys, vectors, misses = await loop.run_in_executor(None, self._lookup, texts)
+        new_vectors = await self.embeddings.aembed_documents([texts[i] for i in misses]) if misses else []
+        return await loop.run_in_executor(None, self._merge, keys, vectors, misses, new_vectors)
+    
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        vector = self.query_cache.get(key)
+        if vector is None:
+            keys, vectors, misses = self._lookup([text])
+            new_vectors = [self.embeddings.embed_query(text)] if misses else []
+            vector = self._merge(keys, vectors, misses, new_vectors)[0]
+            self.query_cache[key] = vector
+        return vector
+    
+    async def aembed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        vector = self.query_cache.get(key)
+        if vector is None:
+            loop = asyncio.get_running_loop()
+            keys, vectors, misses = await loop.run_in_executor(None, self._lookup, [text])
+            new_vectors = [await self.embeddings.aembed_query(text)] if misses else []
+            vector = (await loop.run_in_executor(None, self._merge, keys, vectors, misses, new_vectors))[0]
+            self.query_cache[key] = vector
+        return vector
+
+# Terms that change the answer but barely move the embedding: record numbers, dates and other digits,
+# month names, relative periods and priority words. A semantic cache hit requires these to match exactly.
+QUERY_KEY_TERMS_RE = re.compile(
+    r'\b(?:\w*\d\w*|jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?'
+    r'|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?|today|yesterday|last|this|next|previous'
+    r'|critical|high|moderate|medium|low|planning)\b',
+    re.IGNORECASE
+)
+# Nearest cached questions checked for a semantic hit with matching key terms
+SEMANTIC_CANDIDATES = 4
+
+class QueryCache:
+    """Two-tier response cache: exact match on normalized question, then semantic match on query embeddings
+    
+    Entries are (raw answer, formatted answer) pairs and only cover questions asked without chat history.
+    """
+    
+    def __init__(self, maxsize: int = 1024, ttl: int = 3600, threshold: float = 0.98):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self.exact = TTLCache(maxsize=maxsize, ttl=ttl)
+        # In-memory inner-product index over normalized query vectors (IP = cosine)
+        self.index = None
+        self.entries = []  # (created_at, key_terms, (answer, formatted_answer)) aligned with index ids
+    
+    @staticmethod
+    def _key(question: str) -> str:
+        return hashlib.sha256(question.strip().lower().encode()).hexdigest()
+    
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        vector = np.asarray(vector, dtype='float32').reshape(1, -1)
+        faiss.normalize_L2(vector)
+        return vector
+    
+    @staticmethod
+    def _key_terms(question: str) -> frozenset:
+        return frozenset(term.lower() for term in QUERY_KEY_TERMS_RE.findall(question))
+    
+    def get_exact(self, question: str) -> Optional[Tuple[str, str]]:
+        return self.exact.get(self._key(question))
+    
+    def get_semantic(self, question: str, query_vector: List[float]) -> Optional[Tuple[str, str]]:
+        if self.index is None or self.index.ntotal == 0:
+            return None
+        
+        # "RCA for INC0012347" and "RCA for INC0012348" embed almost identically, so similar
+        # questions only share an answer when their identifiers, dates and priorities match
+        key_terms = self._key_terms(question)
+        scores, ids = self.index.search(self._normalize(query_vector), SEMANTIC_CANDIDATES)
+        now = time.time()
+        for score, entry_id in zip(scores[0], ids[0]):
+            if entry_id < 0 or score < self.threshold:
+                break
+            created_at, entry_terms, response = self.entries[entry_id]
+            if entry_terms == key_terms and now - created_at <= self.ttl:
+                return response
+        return None
+    
+    def put(self, question: str, query_vector: List[float], response: Tuple[str, str]):
+        self.exact[self._key(question)] = response
+        
+        vector = self._normalize(query_vector)
+        if self.index is None:
+            self.index = faiss.IndexFlatIP(vector.shape[1])
+        elif self.index.ntotal >= self.maxsize:
+            # Start over rather than tracking per-entry eviction in the flat index
+            self.index.reset()
+            self.entries.clear()
+        
+        self.index.add(vector)
+        self.entries.append((time.time(), self._key_terms(question), response))
+
 # Initialize FastAPI app
 app = FastAPI()
 templates = Jinja2Templates(directory="templates")
 
 # Load configuration
-config = configparser.ConfigParser()
-config.read('config.properties')
-OPENAI_API_KEY = config.get('DEFAULT', 'apikey')
+config = load_config()
+OPENAI_API_KEY = config['apikey']
 os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
 
+# OpenAI request limits and the Redis-backed queue for long-running questions
+OPENAI_MAX_INFLIGHT = int(config.get('openai_max_inflight', 16))
+OPENAI_RPM = int(config.get('openai_rpm', 500))
+REDIS_URL = config.get('redis_url', 'redis://localhost:6379/0')
+QUEUE_KEY_PREFIX = "chat_job:"
+QUEUE_JOB_TTL = 3600
+# Queued questions beyond this many unfinished jobs are rejected with 429
+QUEUE_MAX_PENDING = int(config.get('queue_max_pending', 100))
+
+# Ingestion worker processes each load their own spaCy model, so the pool is capped
+MAX_INGEST_WORKERS = 8
+INGEST_WORKERS = max(1, min(int(config.get('ingest_workers', os.cpu_count() or 1)), MAX_INGEST_WORKERS))
+
+openai_semaphore = asyncio.Semaphore(OPENAI_MAX_INFLIGHT)
+openai_limiter = AsyncLimiter(max_rate=OPENAI_RPM, time_period=60)
+redis_client = redis.from_url(REDIS_URL, decode_responses=True)
+
 # Log startup information
 logger.info("Starting IT Support Assistant application")
 logger.debug("Configuration loaded successfully")
 
 # Initialize vector store
-embeddings = OpenAIEmbeddings()
+# Documents are embedded in large batches; a local model saturates its device with one batch at a time
+EMBED_BATCH_SIZE = 1000
+EMBED_CONCURRENCY = 1
+# Local 384-dim embedding model: no per-token API cost and ingestion runs fully offline.
+# Queries must be embedded with the same model as the index, so both use it.
+EMBEDDING_MODEL = "BAAI/bge-small-en-v1.5"
+EMBEDDING_DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+# int8 ranges are trained on the first chunk; smaller first chunks get an exact FP32 index instead
+MIN_QUANTIZER_TRAINING_SIZE = 1000
+# Widen each trained per-dimension range by this fraction so later chunks are not clipped
+QUANTIZER_RANGE_MARGIN = 0.1
+# Embedding vectors persist across restarts and re-ingests, keyed by SHA-256 of the text
+EMBED_CACHE_DIR = '.embed_cache'
+embeddings = CachedEmbeddings(HuggingFaceEmbeddings(
+    model_name=EMBEDDING_MODEL,
+    model_kwargs={'device': EMBEDDING_DEVICE},
+    encode_kwargs={'batch_size': 256, 'normalize_embeddings': True}
+), cache_dir=EMBED_CACHE_DIR, namespace=EMBEDDING_MODEL)
+
+# Response cache in front of the QA chain; bge-small cosines cluster high even for related but
+# different IT questions, so the semantic tier only accepts near-paraphrases
+query_cache = QueryCache(maxsize=1024, ttl=3600, threshold=0.98)
+
+# Define optimized query patterns with metadata filters
+QUERY_PATTERNS = {
+    'analytical': {
+        'patterns': ['pattern', 'trend', 'all', 'how many', 'count', 'list', 'analyze', 'summarize'],
+        'k': 50,
+        'description': 'Analytical query for patterns and trends'
+    },
+    'temporal': {
+        'patterns': ['between', 'from', 'to', 'during', 'within', 'time frame'],
+        'k': 100,
+        'description': 'Temporal analysis query'
+    },
+    'category': {
+        'patterns': ['category', 'type of', 'similar to', 'like this'],
+        'k': 25,
+        'description': 'Category-based similarity query'
+    },
+    'priority': {
+        'patterns': ['critical', 'high priority', 'urgent', 'severity'],
+        'k': 30,
+        'description': 'Priority-based query'
+    },
+    'resolution': {
+        'patterns': ['resolved', 'resolution time', 'how long', 'duration'],
+        'k': 40,
+        'description': 'Resolution time analysis'
+    },
+    'team': {
+        'patterns': ['team', 'group', 'assigned to', 'handled by'],
+        'k': 30,
+        'description': 'Team-based analysis'
+    }
+}
+
+def build_query_matcher(query_patterns):
+    """Compile all query patterns into one Aho-Corasick automaton"""
+    automaton = ahocorasick.Automaton()
+    for order, (query_type, config) in enumerate(query_patterns.items()):
+        for pattern in config['patterns']:
+            # Earlier query types win when a pattern is listed more than once
+            if not automaton.exists(pattern):
+                automaton.add_word(pattern, (order, query_type, config['k']))
+    automaton.make_automaton()
+    return automaton
+
+query_matcher = build_query_matcher(QUERY_PATTERNS)
+
+def match_query_type(question):
+    """Return (query_type, k) for the first matching query type in QUERY_PATTERNS order, or None"""
+    # Keep the dict-order precedence of the original pattern loop, not the leftmost match
+    matches = [value for _, value in query_matcher.iter(question)]
+    if not matches:
+        return None
+    _, query_type, k = min(matches)
+    return query_type, k
+
 persist_directory = 'vectordb'
 
 class ChatMessage(BaseModel):
     message: str
 
-def prepare_incident_text(row):
-    """Convert incident row to searchable text with ITIL-focused structure and PII protection"""
+async def embed_texts(texts):
+    """Embed texts in large batches with a bounded number of concurrent requests"""
+    semaphore = asyncio.Semaphore(EMBED_CONCURRENCY)
     
-    # Calculate resolution time if available
-    resolution_time = ""
-    try:
-        if row['Resolved At'] and row['Opened At']:
-            opened = pd.to_datetime(row['Opened At'])
-            resolved = pd.to_datetime(row['Resolved At'])
-            resolution_time = f"\nResolution Time: {(resolved - opened).total_seconds() / 3600:.2f} hours"
-    except:
-        resolution_time = "\nResolution Time: Not available"
-    
-    # Determine incident severity
-    severity = "High" if row['Priority'] in ['1 - Critical', '2 - High'] else \
-               "Medium" if row['Priority'] == '3 - Moderate' else "Low"
-    
-    # Build incident text
-    incident_text = f"""
-    === Incident Details ===
-    Incident Number: {row['Number']}
-    Status: {row['State']}
-    
-    === Classification ===
-    Category: {row['Category']}
-    Subcategory: {row['Subcategory']}
-    
-    === Priority Assessment ===
-    Impact: {row['Impact']}
-    Urgency: {row['Urgency']}
-    Priority: {row['Priority']}
-    Overall Severity: {severity}
-    
-    === Timeline ===
-    Opened: {row['Opened At']}
-    Resolved: {row['Resolved At']}{resolution_time}
-    
-    === Support Details ===
-    Assignment Group: {row['Assignment Group']}
-    Assigned To: {row['Assigned To']}
-    
-    === Description ===
-    Summary: {row['Short Description']}
-    
-    === Detailed Notes ===
-    {row['Notes']}
-    """
+    async def embed_batch(batch):
+        async with semaphore:
+            return await embeddings.aembed_documents(batch)
     
-    # Apply PII protection
-    if pii_protector.enabled:
-        # Get PII summary for logging
-        pii_summary = pii_protector.get_pii_summary(incident_text)
-        if pii_summary['pii_count'] > 0:
-            logger.info(f"PII detected in incident {row['Number']}: {pii_summary['pii_count']} entities of types {pii_summary['types']}")
-        
-        # Anonymize the text
-        incident_text = pii_protector.anonymize_text(incident_text, log_findings=False)
+    batches = [texts[i:i + EMBED_BATCH_SIZE] for i in range(0, len(texts), EMBED_BATCH_SIZE)]
+    results = await asyncio.gather(*(embed_batch(batch) for batch in batches))
+    return [vector for batch in results for vector in batch]
+
+def create_quantized_index(training_vectors):
+    """Build an int8 scalar-quantized inner-product index, or a flat one when there is too little training data"""
+    training_vectors = np.asarray(training_vectors, dtype='float32')
+    faiss.normalize_L2(training_vectors)
+    dimension = training_vectors.shape[1]
+    
+    # A handful of vectors cannot estimate per-dimension ranges for the rest of the export
+    if len(training_vectors) < MIN_QUANTIZER_TRAINING_SIZE:
+        logger.info(f"Only {len(training_vectors)} vectors to train on, using an exact FP32 index")
+        return faiss.IndexFlatIP(dimension)
+    
+    # One byte per dimension instead of four; no FP32 copy is kept, so memory drops to about a quarter
+    index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+    index.sq.rangestat = faiss.ScalarQuantizer.RS_minmax
+    index.sq.rangestat_arg = QUANTIZER_RANGE_MARGIN
+    index.train(training_vectors)
+    return index
+
+async def add_documents_with_embeddings(vectorstore, documents):
+    """Embed documents concurrently and add them to the FAISS index in bulk"""
+    contents = [doc.page_content for doc in documents]
+    vectors = await embed_texts(contents)
+    text_embeddings = list(zip(contents, vectors))
+    metadatas = [doc.metadata for doc in documents]
+    
+    # Inner-product search over L2-normalized vectors (IP = cosine similarity)
+    if vectorstore is None:
+        vectorstore = FAISS(
+            embedding_function=embeddings,
+            index=create_quantized_index(vectors),
+            docstore=InMemoryDocstore(),
+            index_to_docstore_id={},
+            normalize_L2=True,
+            distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT
+        )
     
-    return incident_text
+    vectorstore.add_embeddings(text_embeddings, metadatas=metadatas)
+    return vectorstore
+
+async def read_next_documents(reader, pool):
+    """Read the next CSV chunk and build its documents across worker processes, or return None at end of file"""
+    loop = asyncio.get_running_loop()
+    chunk = await loop.run_in_executor(None, next, reader, None)
+    if chunk is None:
+        return None
+    
+    # Text and metadata assembly is GIL-bound, so each shard is built in its own process
+    shard_size = -(-len(chunk) // INGEST_WORKERS)
+    shards = [chunk.iloc[start:start + shard_size] for start in range(0, len(chunk), shard_size)]
+    results = await asyncio.gather(*(
+        loop.run_in_executor(pool, build_incident_documents, shard) for shard in shards
+    ))
+    return [doc for docs in results for doc in docs]
 
-def initialize_vectorstore():
+async def initialize_vectorstore():
     """Initialize or load the vector store with incident data"""
-    df = pd.read_csv('Snow_Incidents.csv')
+    loop = asyncio.get_running_loop()
+    
+    # Load existing vector store without touching the CSV
+    if os.path.exists(os.path.join(persist_directory, 'index.faiss')):
+        return await loop.run_in_executor(None, lambda: FAISS.load_local(
+            persist_directory,
+            embeddings,
+            allow_dangerous_deserialization=True,  # Index files are written by this application
+            normalize_L2=True,
+            distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT
+        ))
+    
+    vectorstore = None
+    
+    # Stream the CSV so memory stays bounded by the chunk size rather than the export size
+    reader = pd.read_csv(
+        INCIDENT_FILE,
+        chunksize=CSV_CHUNK_SIZE,
+        usecols=INCIDENT_COLUMNS,
+        dtype=INCIDENT_DTYPES
+    )
     
-    # Process incidents with enhanced metadata and relationships
-    documents = []
-    metadata = []
+    # Prepare the next chunk in worker processes while the current one is being embedded.
+    # Workers are spawned rather than forked because the parent already runs logging and event loop threads;
+    # they only import the lightweight ingest module, never this app.
+    total = 0
+    with ProcessPoolExecutor(
+        max_workers=INGEST_WORKERS,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=init_worker_logging
+    ) as pool:
+        next_documents = asyncio.ensure_future(read_next_documents(reader, pool))
+        while True:
+            texts = await next_documents
+            if texts is None:
+                break
+            next_documents = asyncio.ensure_future(read_next_documents(reader, pool))
+            total += len(texts)
+            texts = await loop.run_in_executor(None, deduplicate_documents, texts)
+            vectorstore = await add_documents_with_embeddings(vectorstore, texts)
+            logger.info(f"Indexed {total} incidents")
     
-    # First pass: Create basic documents and metadata
-    for _, row in df.iterrows():
-        text = prepare_incident_text(row)
-        
-        # Calculate severity
-        severity = "High" if row['Priority'] in ['1 - Critical', '2 - High'] else \
-                  "Medium" if row['Priority'] == '3 - Moderate' else "Low"
-        
-        # Calculate resolution time with better error handling
-        resolution_hours = None
-        try:
-            if pd.notna(row['Resolved At']) and pd.notna(row['Opened At']):
-                opened = pd.to_datetime(row['Opened At'])
-                resolved = pd.to_datetime(row['Resolved At'])
-                resolution_hours = (resolved - opened).total_seconds() / 3600
-        except (ValueError, TypeError) as e:
-            logger.warning(f"Error calculating resolution time for incident {row['Number']}: {e}")
-            pass
-        
-        # Create focused metadata optimized for efficient querying
-        opened_dt = pd.to_datetime(row['Opened At'])
-        
-        meta = {
-            # Primary identifiers
-            'incident_id': row['Number'],
-            
-            # Core categorization (for filtering and grouping)
-            'category': row['Category'],
-            'subcategory': row['Subcategory'],
-            
-            # Priority and impact (for severity-based queries)
-            'priority_level': row['Priority'].split(' - ')[0],  # Just the number
-            'severity': severity,
-            
-            # Operational status
-            'state': row['State'],
-            'team': row['Assignment Group'],
-            
-            # Temporal attributes (for time-based queries)
-            'timestamp': opened_dt.timestamp(),  # Unix timestamp for efficient range queries
-            'year_month': opened_dt.strftime('%Y-%m'),  # For monthly aggregations
-            'year': str(opened_dt.year),  # For yearly aggregations
-            
-            # Resolution metrics (if available)
-            'is_resolved': bool(pd.notna(row['Resolved At'])),
-            'resolution_hours': resolution_hours if resolution_hours is not None else -1,
-        }
-        
-        documents.append(text)
-        metadata.append(meta)
-    
-    # Convert to LangChain documents with optimized metadata
-    texts = [
-        Document(page_content=doc, metadata=meta)
-        for doc, meta in zip(documents, metadata)
-    ]
-    
-    # Create or load vector store
-    if os.path.exists(persist_directory):
-        vectorstore = Chroma(persist_directory=persist_directory, embedding_function=embeddings)
-    else:
-        vectorstore = Chroma.from_documents(
-            documents=texts,
-            embedding=embeddings,
-            persist_directory=persist_directory
-        )
+    # An export with a header and no rows leaves nothing to index or save
+    if vectorstore is None:
+        raise ValueError(f"{INCIDENT_FILE} contains no incidents")
     
+    await loop.run_in_executor(None, vectorstore.save_local, persist_directory)
     return vectorstore
 
-def create_qa_chain(vectorstore):
-    """Create an enhanced conversational QA chain with dynamic prompting and retrieval"""
-    template = """You are an ITIL-certified Production Support Expert specializing in ServiceNow incident analysis and resolution.
-    Your role is to provide expert analysis of incidents, root cause analysis (RCA), and actionable solutions.
-    
-    Key Responsibilities:
-    - Analyze incident patterns and trends
-    - Identify root causes and systemic issues
-    - Provide data-driven recommendations
-    - Ensure compliance with ITIL practices
-    
-    Knowledge Base Context:
-    - You have access to historical incident data
-    - Each incident includes detailed metadata
-    - Time-based patterns are important
-    - Priority and severity correlations matter
-
-    Guidelines for your responses:
-    1. For analytical queries (patterns, trends, statistics):
-       - Present data in HTML tables with clear headers
-       - Use proper formatting: <table><tr><th>Header</th></tr><tr><td>Data</td></tr></table>
-       - Include relevant metrics and percentages
-       - Maximum of 10 rows unless specifically asked for more
-
-    2. For RCA and solution queries:
-       - Structure your response in clear sections
-       - Keep responses concise (max 300 words)
-       - Include: Root Cause, Impact, Resolution Steps, Prevention Measures
-       - Highlight critical information
-
-    3. For time-based analysis:
-       - Clearly specify the time period analyzed
-       - Show trends and patterns
-       - Use proper date comparisons
-
-    4. Response Format:
-       - Use bullet points for lists
-       - Keep paragraphs short (2-3 sentences)
-       - Use HTML formatting for emphasis when needed
-       - If providing steps, number them clearly
-
-    Current Context: {context}
-    Previous Conversation: {chat_history}
-    Current Question: {question}
-
-    Provide your expert analysis based on the above guidelines.
-    Answer: """
-
-    PROMPT = PromptTemplate(
-        input_variables=["context", "chat_history", "question"],
-        template=template
-    )
+# Static role and guidelines go first so OpenAI can reuse the cached prompt prefix across requests
+SYSTEM_PROMPT = """You are an ITIL-certified Production Support Expert specializing in ServiceNow incident analysis and resolution.
+Your role is to provide expert analysis of incidents, root cause analysis (RCA), and actionable solutions.
+
+Key Responsibilities:
+- Analyze incident patterns and trends
+- Identify root causes and systemic issues
+- Provide data-driven recommendations
+- Ensure compliance with ITIL practices
+
+Knowledge Base Context:
+- You have access to historical incident data
+- Each incident includes detailed metadata
+- Time-based patterns are important
+- Priority and severity correlations matter
+
+Guidelines for your responses:
+1. For analytical queries (patterns, trends, statistics):
+   - Present data in HTML tables with clear headers
+   - Use proper formatting: <table><tr><th>Header</th></tr><tr><td>Data</td></tr></table>
+   - Include relevant metrics and percentages
+   - Maximum of 10 rows unless specifically asked for more
+
+2. For RCA and solution queries:
+   - Structure your response in clear sections
+   - Keep responses concise (max 300 words)
+   - Include: Root Cause, Impact, Resolution Steps, Prevention Measures
+   - Highlight critical information
+
+3. For time-based analysis:
+   - Clearly specify the time period analyzed
+   - Show trends and patterns
+   - Use proper date comparisons
 
+4. Response Format:
+   - Use bullet points for lists
+   - Keep paragraphs short (2-3 sentences)
+   - Use HTML formatting for emphasis when needed
+   - If providing steps, number them clearly
+
+Provide your expert analysis based on the above guidelines."""
+
+QA_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", SYSTEM_PROMPT),
+    MessagesPlaceholder("chat_history"),
+    ("human", "Current Context:\n{context}\n\nQ: {input}")
+])
+
+# Rephrases follow-up questions into standalone search queries when there is chat history
+CONDENSE_PROMPT = ChatPromptTemplate.from_messages([
+    MessagesPlaceholder("chat_history"),
+    ("human", "{input}"),
+    ("human", "Given the conversation above, rephrase the last question as a standalone question "
+              "for searching incident records. Return only the question.")
+])
+
+def create_qa_chain(vectorstore, k=20):
+    """Create a conversational retrieval chain with a static system prompt"""
     # Use GPT-4o Mini with large context window (128k tokens) at lower cost
     llm = ChatOpenAI(
         model="gpt-4o-mini",  # GPT-4o Mini with 128k context window
         temperature=0.7,
-        max_tokens=4096  # Allow up to 4k tokens for response, leaving ~124k for input
-    )
-    memory = ConversationBufferMemory(
-        memory_key="chat_history",
-        return_messages=True
+        max_tokens=4096,  # Allow up to 4k tokens for response, leaving ~124k for input
+        http_async_client=openai_http_client
     )
 
     # Create retriever with only supported parameters
     retriever = vectorstore.as_retriever()
-    retriever.search_kwargs = {"k": 20}  # Increased default for larger context window
+    retriever.search_kwargs = {"k": k}
     
-    qa_chain = ConversationalRetrievalChain.from_llm(
-        llm=llm,
-        retriever=retriever,
-        memory=memory,
-        combine_docs_chain_kwargs={"prompt": PROMPT}
+    # Chat history is passed in per request so concurrent sessions never share memory
+    history_aware_retriever = create_history_aware_retriever(llm, retriever, CONDENSE_PROMPT)
+    qa_chain = create_retrieval_chain(
+        history_aware_retriever,
+        create_stuff_documents_chain(llm, QA_PROMPT)
     )
     
     return qa_chain
 
-# Initialize vector store and QA chain
-vectorstore = initialize_vectorstore()
-qa_chain = create_qa_chain(vectorstore)
+def get_qa_chain(k):
+    """Return the QA chain for a retrieval depth, building it on first use"""
+    # One chain per k avoids mutating a shared retriever while other requests are in flight
+    qa_chains = app.state.qa_chains
+    if k not in qa_chains:
+        qa_chains[k] = create_qa_chain(app.state.vectorstore, k)
+    return qa_chains[k]
+
+def get_session_history(session_id):
+    """Return the chat message history for a chat session"""
+    history = session_memories.get(session_id)
+    if history is None:
+        history = InMemoryChatMessageHistory()
+    # Storing the history again on every access restarts its TTL, so sessions expire after inactivity
+    session_memories[session_id] = history
+    return history
+
+# Shared async HTTP connection pool for OpenAI chat completions
+openai_http_client = httpx.AsyncClient(limits=httpx.Limits(max_connections=64))
+
+# Conversation memory per browser session, expired after an hour of inactivity
+SESSION_COOKIE = "session_id"
+session_memories = TTLCache(maxsize=10_000, ttl=3600)
+
+# Vector store and QA chains are built after startup so the server can answer health checks meanwhile
+app.state.vectorstore = None
+app.state.qa_chains = {}
+app.state.qa_chain = None
+app.state.init_error = None
+app.state.pending_jobs = 0
+
+async def initialize_qa():
+    """Load or build the vector store, then create the default QA chain"""
+    try:
+        app.state.vectorstore = await initialize_vectorstore()
+        app.state.qa_chain = get_qa_chain(20)
+        logger.info("Vector store and QA chain ready")
+    except Exception as e:
+        logger.error(f"Error initializing vector store: {e}", exc_info=True)
+        app.state.init_error = str(e)
+
+@app.on_event("startup")
+async def startup():
+    # Keep a reference so the initialization task is not garbage collected
+    app.state.init_task = asyncio.create_task(initialize_qa())
+
+@app.get("/healthz")
+async def healthz():
+    """Report readiness once the QA chain is available, or the error that stopped initialization"""
+    if app.state.init_error is not None:
+        return JSONResponse(status_code=503, content={"status": "failed", "error": app.state.init_error})
+    if app.state.qa_chain is None:
+        return JSONResponse(status_code=503, content={"status": "initializing"})
+    return {"status": "ok"}
 
 @app.get("/", response_class=HTMLResponse)
 async def root(request: Request):
     return templates.TemplateResponse("chat.html", {"request": request})
 
-@app.post("/chat")
-async def chat(message: ChatMessage):
+# Paragraph breaks, bullets and single-digit list numbers (not the digits of "12.")
+ANSWER_FORMAT_RE = re.compile(r'(\n\n)|(•)|(?<!\d)([1-9])\.')
+
+def format_answer_match(match):
+    """Return the HTML replacement for one ANSWER_FORMAT_RE match"""
+    if match.group(1):
+        return '<br><br>'
+    if match.group(2):
+        return '<br>•'
+    return f'<br>{match.group(3)}.'
+
+def get_session_id(request: Request, http_response: Response):
+    """Return the chat session id from the cookie, issuing a new one if missing"""
+    session_id = request.cookies.get(SESSION_COOKIE)
+    if session_id is None:
+        session_id = str(uuid.uuid4())
+        http_response.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite="lax")
+    return session_id
+
+async def answer_question(message_text: str, session_id: str) -> Dict:
+    """Answer a user question through the cache and QA chain for the given session"""
     metrics = QueryMetrics()
-    original_message = message.message
+    history = get_session_history(session_id)
+    original_message = message_text
     logger.info(f"Received question: {original_message}")
     
     # Apply PII protection to user query
-    protected_message = message.message
+    protected_message = message_text
     if pii_protector.enabled:
-        pii_summary = pii_protector.get_pii_summary(message.message)
+        pii_summary = pii_protector.get_pii_summary(message_text)
         if pii_summary['pii_count'] > 0:
             logger.warning(f"PII detected in user query: {pii_summary['pii_count']} entities of types {pii_summary['types']}")
-            protected_message = pii_protector.anonymize_text(message.message)
+            protected_message = pii_protector.anonymize_text(message_text)
             logger.info("User query anonymized for processing")
     
     try:
+        # Follow-up questions depend on the conversation so far, so only standalone questions use the cache
+        use_cache = not history.messages
+        
+        # Serve repeated questions from the cache before doing any retrieval
+        cached = None
+        query_vector = None
+        if use_cache:
+            cached = query_cache.get_exact(protected_message)
+            cache_status = "exact_hit"
+            if cached is None:
+                query_vector = await embeddings.aembed_query(protected_message)
+                cached = query_cache.get_semantic(protected_message, query_vector)
+                cache_status = "semantic_hit"
+        
+        if cached is not None:
+            cached_answer, cached_formatted = cached
+            perf_metrics = metrics.to_dict()
+            perf_metrics['cache'] = cache_status
+            logger.info(f"Query served from cache ({cache_status})")
+            # History keeps the raw answer, as on a cache miss
+            history.add_user_message(protected_message)
+            history.add_ai_message(cached_answer)
+            return {
+                "response": cached_formatted,
+                "metrics": perf_metrics
+            }
+        
         # Preprocess the question to identify query type
         question = protected_message.lower()
         
@@ -452,62 +678,33 @@ async def chat(message: ChatMessage):
         k = 20  # default number of documents to retrieve (increased for GPT-4)
         search_type = "default"
         
-        # Define optimized query patterns with metadata filters
-        query_patterns = {
-            'analytical': {
-                'patterns': ['pattern', 'trend', 'all', 'how many', 'count', 'list', 'analyze', 'summarize'],
-                'k': 50,
-                'description': 'Analytical query for patterns and trends'
-            },
-            'temporal': {
-                'patterns': ['between', 'from', 'to', 'during', 'within', 'time frame'],
-                'k': 100,
-                'description': 'Temporal analysis query'
-            },
-            'category': {
-                'patterns': ['category', 'type of', 'similar to', 'like this'],
-                'k': 25,
-                'description': 'Category-based similarity query'
-            },
-            'priority': {
-                'patterns': ['critical', 'high priority', 'urgent', 'severity'],
-                'k': 30,
-                'description': 'Priority-based query'
-            },
-            'resolution': {
-                'patterns': ['resolved', 'resolution time', 'how long', 'duration'],
-                'k': 40,
-                'description': 'Resolution time analysis'
-            },
-            'team': {
-                'patterns': ['team', 'group', 'assigned to', 'handled by'],
-                'k': 30,
-                'description': 'Team-based analysis'
-            }
-        }
-        
-        # Determine query type and adjust retrieval strategy
-        for query_type, config in query_patterns.items():
-            if any(pattern in question for pattern in config['patterns']):
-                k = config['k']
-                search_type = query_type
-                logger.debug(f"{config['description']} detected, adjusting retrieval strategy: k={k}")
-                break
+        # Determine query type with a single scan over all patterns
+        match = match_query_type(question)
+        if match is not None:
+            search_type, k = match
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"{QUERY_PATTERNS[search_type]['description']} detected, adjusting retrieval strategy: k={k}")
             
         logger.info(f"Query type: {search_type}, Parameters: k={k}")
         
-        # Update retriever with optimized parameters (only ChromaDB compatible params)
-        qa_chain.retriever.search_kwargs.update({
-            'k': k
-        })
-        
-        # Get response from QA chain with token tracking
+        # Get response from the QA chain for this retrieval depth with token tracking
+        qa_chain = get_qa_chain(k)
         with get_openai_callback() as cb:
-            response = qa_chain.invoke({"question": protected_message})
+            # Bound in-flight requests and requests per minute to stay under OpenAI rate limits;
+            # a follow-up question costs two calls (condense the question, then answer it)
+            openai_calls = 2 if history.messages else 1
+            async with openai_semaphore:
+                await openai_limiter.acquire(openai_calls)
+                result = await qa_chain.ainvoke({
+                    "input": protected_message,
+                    "chat_history": history.messages
+                })
             metrics.record_token_usage(cb)
         
         # Post-process response for better formatting
-        answer = response["answer"]
+        answer = result["answer"]
+        history.add_user_message(protected_message)
+        history.add_ai_message(answer)
         
         # If response contains a table, ensure proper HTML formatting
         if '<table>' in answer:
@@ -516,21 +713,23 @@ async def chat(message: ChatMessage):
         else:
             # For text responses, add basic HTML formatting
             logger.debug("Text response detected, adding HTML formatting")
-            formatted_answer = answer.replace('\n\n', '<br><br>')
-            formatted_answer = formatted_answer.replace('•', '<br>•')
-            for i in range(1, 10):
-                formatted_answer = formatted_answer.replace(f"{i}.", f"<br>{i}.")
+            formatted_answer = ANSWER_FORMAT_RE.sub(format_answer_match, answer)
+        
+        if use_cache:
+            query_cache.put(protected_message, query_vector, (answer, formatted_answer))
         
         # Log performance metrics
         perf_metrics = metrics.to_dict()
+        perf_metrics['cache'] = "miss" if use_cache else "skipped"
         logger.info("Query processed successfully", extra={
             'metrics': perf_metrics,
             'query_type': 'table' if '<table>' in answer else 'text',
             'retrieved_docs': k
         })
         
-        # Log detailed metrics for analysis
-        logger.debug(f"Performance metrics: {json.dumps(perf_metrics, indent=2)}")
+        # Log detailed metrics for analysis (skip the JSON encoding when DEBUG is off)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Performance metrics: {json.dumps(perf_metrics, indent=2)}")
         
         return {
             "response": formatted_answer,
@@ -545,13 +744,84 @@ async def chat(message: ChatMessage):
             "metrics": metrics.to_dict()
         }
 
+@app.post("/chat")
+async def chat(message: ChatMessage, request: Request, http_response: Response):
+    if app.state.init_error is not None:
+        return JSONResponse(status_code=503, content={
+            "response": f"The incident knowledge base failed to load: {app.state.init_error}",
+            "metrics": QueryMetrics().to_dict()
+        })
+    if app.state.qa_chain is None:
+        return JSONResponse(status_code=503, content={
+            "response": "The incident knowledge base is still loading. Please try again shortly.",
+            "metrics": QueryMetrics().to_dict()
+        })
+    session_id = get_session_id(request, http_response)
+    return await answer_question(message.message, session_id)
+
+async def run_queued_question(job_id: str, message_text: str, session_id: str):
+    """Answer a queued question and store the result for polling"""
+    try:
+        result = await answer_question(message_text, session_id)
+        job = {"status": "finished", "response": result}
+    except Exception as e:
+        logger.error(f"Queued job {job_id} failed: {e}", exc_info=True)
+        job = {"status": "failed", "response": None, "error": str(e)}
+    finally:
+        app.state.pending_jobs -= 1
+    
+    try:
+        await redis_client.setex(f"{QUEUE_KEY_PREFIX}{job_id}", QUEUE_JOB_TTL, json.dumps(job))
+    except redis.RedisError as e:
+        logger.error(f"Could not store result of queued job {job_id}: {e}")
+
+@app.post("/queue/request")
+async def queue_request(message: ChatMessage, request: Request, http_response: Response,
+                        background_tasks: BackgroundTasks):
+    """Queue a question and return a job id immediately instead of holding the connection"""
+    if app.state.init_error is not None:
+        return JSONResponse(status_code=503, content={
+            "error": f"The incident knowledge base failed to load: {app.state.init_error}"
+        })
+    if app.state.qa_chain is None:
+        return JSONResponse(status_code=503, content={"error": "The incident knowledge base is still loading"})
+    if app.state.pending_jobs >= QUEUE_MAX_PENDING:
+        return JSONResponse(status_code=429, content={"error": "Too many queued questions, try again later"})
+    session_id = get_session_id(request, http_response)
+    job_id = str(uuid.uuid4())
+    try:
+        await redis_client.setex(
+            f"{QUEUE_KEY_PREFIX}{job_id}",
+            QUEUE_JOB_TTL,
+            json.dumps({"status": "queued", "response": None})
+        )
+    except redis.RedisError as e:
+        logger.error(f"Could not queue question: {e}")
+        return JSONResponse(status_code=503, content={"error": "The job queue is unavailable"})
+    app.state.pending_jobs += 1
+    background_tasks.add_task(run_queued_question, job_id, message.message, session_id)
+    logger.info(f"Queued question as job {job_id}")
+    return {"job_id": job_id, "status": "queued"}
+
+@app.get("/queue/response/{job_id}")
+async def queue_response(job_id: str):
+    """Poll the status and result of a queued question"""
+    try:
+        job = await redis_client.get(f"{QUEUE_KEY_PREFIX}{job_id}")
+    except redis.RedisError as e:
+        logger.error(f"Could not read queued job {job_id}: {e}")
+        return JSONResponse(status_code=503, content={"error": "The job queue is unavailable"})
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Unknown or expired job id"})
+    return {"job_id": job_id, **json.loads(job)}
+
 @app.get("/pii-status")
 async def get_pii_status():
     """Get PII protection status and configuration"""
     return {
         "pii_protection_enabled": pii_protector.enabled,
         "entities_detected": pii_protector.pii_entities if pii_protector.enabled else [],
-        "presidio_version": "2.2.35+" if pii_protector.enabled else "Not installed"
+        "presidio_version": "2.2.354+" if pii_protector.enabled else "Not installed"
     }
 
 @app.post("/analyze-pii")
@@ -0,0 +1,23 @@
+# Shared application configuration
+# Reads config.properties once per process so every module sees the same settings
+
+import configparser
+import functools
+from types import MappingProxyType
+
+CONFIG_FILE = 'config.properties'
+
+@functools.lru_cache(maxsize=1)
+def load_config():
+    """Load the DEFAULT section of config.properties as a read-only mapping"""
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE)
+    settings = dict(config['DEFAULT'])
+    
+    # The OpenAI key has been stored as both 'apikey' and 'api_key'; expose it under both names
+    api_key = settings.get('apikey', settings.get('api_key'))
+    if api_key is not None:
+        settings['apikey'] = api_key
+        settings['api_key'] = api_key
+    
+    return MappingProxyType(settings)
@@ -0,0 +1,437 @@
+# Incident ingestion: CSV settings, PII protection, text and metadata assembly, deduplication
+# Kept free of the web app, embedding model and network clients so ingestion worker processes stay small
+
+import functools
+import logging
+import logging.config
+from typing import List, Dict, Optional
+import numpy as np
+import pandas as pd
+import xxhash
+from datasketch import MinHash, MinHashLSH
+from langchain.schema import Document
+
+# PII Protection imports
+from presidio_analyzer import AnalyzerEngine, BatchAnalyzerEngine
+from presidio_anonymizer import AnonymizerEngine, BatchAnonymizerEngine
+from presidio_anonymizer.entities import OperatorConfig
+
+# Import PII configuration
+try:
+    from pii_config import PII_ENTITIES, CONFIG, INCIDENT_PRESERVATION
+except ImportError:
+    # Fallback configuration if pii_config.py is not available
+    PII_ENTITIES = ["PERSON", "EMAIL_ADDRESS", "PHONE_NUMBER", "CREDIT_CARD", "US_SSN", "IP_ADDRESS", "US_DRIVER_LICENSE"]
+    CONFIG = {"enabled": True, "excluded_entities": ["DATE_TIME"], "min_confidence": 0.6}
+    INCIDENT_PRESERVATION = {"preserve_patterns": [r"INC\d+", r"CHG\d+", r"PRB\d+", r"TASK\d+"]}
+
+# Texts per spaCy batch when anonymizing incident documents
+PII_BATCH_SIZE = 64
+# First release supporting allow_list_match and batch_size/n_process in analyze_iterator
+PRESIDIO_REQUIREMENT = "presidio-analyzer>=2.2.354"
+
+logger = logging.getLogger('chatbot')
+
+def init_worker_logging():
+    """Configure logging in an ingestion worker process"""
+    logging.config.fileConfig('logging.conf', disable_existing_loggers=False)
+
+# Incident CSV ingestion settings
+INCIDENT_FILE = 'Snow_Incidents.csv'
+CSV_CHUNK_SIZE = 10_000
+# Near-duplicate detection over word shingles (Jaccard similarity estimated with MinHash-LSH)
+NEAR_DUPLICATE_THRESHOLD = 0.9
+MINHASH_PERMUTATIONS = 128
+SHINGLE_SIZE = 3
+# Near-duplicate descriptions are merged into one document only when this metadata also matches;
+# otherwise each incident keeps its own document and embedding
+DEDUPE_METADATA_FIELDS = ('category', 'subcategory', 'priority_level', 'state', 'team', 'year_month')
+DESCRIPTION_MARKER = "=== Description ==="
+INCIDENT_COLUMNS = [
+    'Number', 'State', 'Category', 'Subcategory', 'Impact', 'Urgency', 'Priority',
+    'Opened At', 'Resolved At', 'Assignment Group', 'Assigned To',
+    'Short Description', 'Notes'
+]
+# Low-cardinality columns are stored as categoricals to keep each chunk small
+INCIDENT_DTYPES = {
+    'Priority': 'category',
+    'Category': 'category',
+    'Subcategory': 'category',
+    'State': 'category',
+    'Assignment Group': 'category'
+}
+# ServiceNow export timestamp format, e.g. 7/16/2025 15:00
+INCIDENT_DATE_FORMAT = '%m/%d/%Y %H:%M'
+# Priority lookups for derived metadata
+PRIORITY_LEVEL = {
+    '1 - Critical': '1',
+    '2 - High': '2',
+    '3 - Moderate': '3',
+    '4 - Low': '4',
+    '5 - Planning': '5'
+}
+SEVERITY = {
+    '1 - Critical': 'High',
+    '2 - High': 'High',
+    '3 - Moderate': 'Medium',
+    '4 - Low': 'Low',
+    '5 - Planning': 'Low'
+}
+# Attribute names used when iterating incident rows as tuples
+INCIDENT_FIELDS = {column: column.lower().replace(' ', '_') for column in INCIDENT_COLUMNS}
+
+# PII Protection Configuration
+class PIIProtector:
+    """Handles PII detection and anonymization using Microsoft Presidio"""
+    
+    def __init__(self):
+        try:
+            # Initialize Presidio engines
+            self.analyzer = AnalyzerEngine()
+            self.anonymizer = AnonymizerEngine()
+            self.batch_analyzer = BatchAnalyzerEngine(analyzer_engine=self.analyzer)
+            self.batch_anonymizer = BatchAnonymizerEngine(anonymizer_engine=self.anonymizer)
+            
+            # Use entities from configuration, excluding DATE_TIME for incident data
+            self.pii_entities = [entity for entity in PII_ENTITIES 
+                               if entity not in CONFIG.get("excluded_entities", [])]
+            
+            # Define anonymization operators
+            self.operators = {
+                "PERSON": OperatorConfig("replace", {"new_value": "[PERSON]"}),
+                "EMAIL_ADDRESS": OperatorConfig("replace", {"new_value": "[EMAIL]"}),
+                "PHONE_NUMBER": OperatorConfig("replace", {"new_value": "[PHONE]"}),
+                "CREDIT_CARD": OperatorConfig("replace", {"new_value": "[CREDIT_CARD]"}),
+                "US_SSN": OperatorConfig("replace", {"new_value": "[SSN]"}),
+                "IP_ADDRESS": OperatorConfig("replace", {"new_value": "[IP_ADDRESS]"}),
+                "LOCATION": OperatorConfig("replace", {"new_value": "[LOCATION]"}),
+                "ORGANIZATION": OperatorConfig("replace", {"new_value": "[ORGANIZATION]"}),
+                "US_DRIVER_LICENSE": OperatorConfig("replace", {"new_value": "[DRIVER_LICENSE]"}),
+            }
+            
+            self.enabled = CONFIG.get("enabled", True)
+            self.min_confidence = CONFIG.get("min_confidence", 0.6)
+            
+            # Shared analyzer arguments; record identifiers (INC/CHG/PRB/TASK numbers) are allow-listed
+            # so they are never reported or replaced
+            self.analyze_kwargs = {
+                "entities": self.pii_entities,
+                "score_threshold": self.min_confidence,
+                "allow_list": INCIDENT_PRESERVATION.get("preserve_patterns", []),
+                "allow_list_match": "regex"
+            }
+            # Older Presidio releases reject these arguments; fail now rather than skip redaction later
+            self.analyzer.analyze(text="INC0000000", language='en', **self.analyze_kwargs)
+            logger.info(f"PII Protection initialized - Entities: {self.pii_entities}")
+            
+        except TypeError as e:
+            raise RuntimeError(f"{PRESIDIO_REQUIREMENT} is required for PII protection: {e}") from e
+        except ImportError as e:
+            logger.warning(f"Presidio not available: {e}. PII protection disabled.")
+            self.enabled = False
+        except Exception as e:
+            logger.error(f"Error initializing PII protection: {e}. PII protection disabled.")
+            self.enabled = False
+    
+    def analyze_text(self, text: str) -> List[Dict]:
+        """Analyze text for PII entities"""
+        if not self.enabled or not text:
+            return []
+        
+        try:
+            # Analyze text for PII
+            results = self.analyzer.analyze(
+                text=text,
+                language='en',
+                **self.analyze_kwargs
+            )
+            
+            # Convert to dictionary format for logging
+            pii_findings = []
+            for result in results:
+                pii_findings.append({
+                    'entity_type': result.entity_type,
+                    'confidence': result.score,
+                    'start': result.start,
+                    'end': result.end,
+                    'text': text[result.start:result.end]
+                })
+            
+            return pii_findings
+            
+        except TypeError:
+            # An incompatible Presidio must not be mistaken for text without PII
+            logger.error(f"Presidio rejected the analyzer arguments; {PRESIDIO_REQUIREMENT} is required")
+            raise
+        except Exception as e:
+            logger.error(f"Error analyzing text for PII: {e}")
+            return []
+    
+    def anonymize_text(self, text: str, log_findings: bool = True) -> str:
+        """Anonymize PII in text while preserving semantic meaning"""
+        if not self.enabled or not text:
+            return text
+        
+        try:
+            # First analyze for PII
+            pii_findings = self.analyze_text(text)
+            
+            # Log PII findings for compliance
+            if log_findings and pii_findings:
+                logger.info(f"PII detected in text: {len(pii_findings)} entities found")
+                if logger.isEnabledFor(logging.DEBUG):
+                    for finding in pii_findings:
+                        logger.debug(f"PII Entity: {finding['entity_type']} (confidence: {finding['confidence']:.2f})")
+            
+            # Anonymize the text
+            analyzer_results = self.analyzer.analyze(
+                text=text,
+                language='en',
+                **self.analyze_kwargs
+            )
+            
+            anonymized_result = self.anonymizer.anonymize(
+                text=text,
+                analyzer_results=analyzer_results,
+                operators=self.operators
+            )
+            
+            return anonymized_result.text
+            
+        except TypeError:
+            raise
+        except Exception as e:
+            logger.error(f"Error anonymizing text: {e}")
+            return text  # Return original text if anonymization fails
+    
+    def anonymize_batch(self, texts: List[str], labels: Optional[List[str]] = None) -> List[str]:
+        """Anonymize many texts with one batched spaCy pass, analyzing each text only once"""
+        if not self.enabled or not texts:
+            return texts
+        
+        try:
+            # Callers already parallelize across processes, so spaCy runs single-process here
+            results_list = list(self.batch_analyzer.analyze_iterator(
+                texts=texts,
+                language='en',
+                batch_size=PII_BATCH_SIZE,
+                n_process=1,
+                **self.analyze_kwargs
+            ))
+            
+            # Log PII findings for compliance
+            for i, results in enumerate(results_list):
+                if results:
+                    label = labels[i] if labels else i
+                    pii_types = list(set([result.entity_type for result in results]))
+                    logger.info(f"PII detected in incident {label}: {len(results)} entities of types {pii_types}")
+            
+            return self.batch_anonymizer.anonymize_list(
+                texts=texts,
+                recognizer_results_list=results_list,
+                operators=self.operators
+            )
+            
+        except TypeError:
+            logger.error(f"Presidio rejected the batch analyzer arguments; {PRESIDIO_REQUIREMENT} is required")
+            raise
+        except Exception as e:
+            logger.error(f"Error anonymizing text batch: {e}")
+            return [self.anonymize_text(text, log_findings=False) for text in texts]
+    
+    def get_pii_summary(self, text: str) -> Dict:
+        """Get summary of PII types found in text"""
+        if not self.enabled:
+            return {"enabled": False, "pii_count": 0, "types": []}
+        
+        findings = self.analyze_text(text)
+        pii_types = list(set([f['entity_type'] for f in findings]))
+        
+        return {
+            "enabled": True,
+            "pii_count": len(findings),
+            "types": pii_types,
+            "high_confidence_count": len([f for f in findings if f['confidence'] > 0.8])
+        }
+
+@functools.lru_cache(maxsize=1)
+def get_pii_protector():
+    """Return the process-wide PII protector, creating the Presidio engines on first use"""
+    return PIIProtector()
+
+def add_derived_fields(df):
+    """Compute timestamps, resolution time and severity for a chunk of incidents in one vectorized pass"""
+    # Rename to attribute-friendly names so rows can be read from itertuples
+    df = df.rename(columns=INCIDENT_FIELDS)
+    
+    # Parse each timestamp column once for the whole chunk
+    # An explicit format keeps pandas on its fixed-format parser; unparseable values become NaT
+    df['opened_dt'] = pd.to_datetime(df['opened_at'], errors='coerce', format=INCIDENT_DATE_FORMAT, cache=True)
+    df['resolved_dt'] = pd.to_datetime(df['resolved_at'], errors='coerce', format=INCIDENT_DATE_FORMAT, cache=True)
+    
+    # Values that were present but did not match the format would otherwise vanish silently
+    for raw, parsed in (('opened_at', 'opened_dt'), ('resolved_at', 'resolved_dt')):
+        unparsed = int((df[raw].notna() & df[parsed].isna()).sum())
+        if unparsed:
+            logger.warning(f"{unparsed} {raw} values did not match {INCIDENT_DATE_FORMAT!r} and were treated as missing")
+    
+    # NaT propagates to NaN for incidents that are not resolved yet
+    df['resolution_hours'] = (df['resolved_dt'] - df['opened_dt']).dt.total_seconds().div(3600)
+    
+    # Map the few distinct priority values once instead of splitting each row
+    df['priority_level'] = df['priority'].map(PRIORITY_LEVEL).astype(object).fillna(
+        df['priority'].astype(str).str.split(' - ').str[0]
+    )
+    df['severity'] = df['priority'].map(SEVERITY).astype(object).fillna('Low').astype('category')
+    return df
+
+def prepare_incident_text(row):
+    """Convert incident row to searchable text with ITIL-focused structure (PII is removed in batch by the caller)"""
+    
+    # Resolution time is precomputed by add_derived_fields (NaN when unavailable)
+    if pd.notna(row.resolution_hours):
+        resolution_time = f"Resolution Time: {row.resolution_hours:.2f} hours"
+    else:
+        resolution_time = "Resolution Time: Not available"
+    
+    # Build incident text without indentation, which would only add prompt tokens
+    incident_text = "\n".join([
+        "=== Incident Details ===",
+        f"Incident Number: {row.number}",
+        f"Status: {row.state}",
+        "",
+        "=== Classification ===",
+        f"Category: {row.category}",
+        f"Subcategory: {row.subcategory}",
+        "",
+        "=== Priority Assessment ===",
+        f"Impact: {row.impact}",
+        f"Urgency: {row.urgency}",
+        f"Priority: {row.priority}",
+        f"Overall Severity: {row.severity}",
+        "",
+        "=== Timeline ===",
+        f"Opened: {row.opened_at}",
+        f"Resolved: {row.resolved_at}",
+        resolution_time,
+        "",
+        "=== Support Details ===",
+        f"Assignment Group: {row.assignment_group}",
+        f"Assigned To: {row.assigned_to}",
+        "",
+        DESCRIPTION_MARKER,
+        f"Summary: {row.short_description}",
+        "",
+        "=== Detailed Notes ===",
+        f"{row.notes}",
+    ])
+    
+    return incident_text
+
+def build_incident_documents(df):
+    """Build LangChain documents with query-optimized metadata for a chunk of incidents"""
+    df = add_derived_fields(df)
+    
+    # Precompute metadata columns as arrays so the loop only assembles text and dicts
+    opened = df['opened_dt']
+    opened_ts = opened.to_numpy().astype('datetime64[s]').astype('int64')
+    timestamps = np.where(opened.isna().to_numpy(), -1, opened_ts).tolist()
+    year_months = opened.dt.strftime('%Y-%m').fillna('').tolist()
+    years = opened.dt.strftime('%Y').fillna('').tolist()
+    is_resolved = df['resolved_at'].notna().tolist()
+    resolution_hours = df['resolution_hours'].fillna(-1).tolist()
+    
+    rows = list(df.itertuples(index=False))
+    
+    # Apply PII protection to the whole chunk in one batched pass
+    contents = get_pii_protector().anonymize_batch(
+        [prepare_incident_text(row) for row in rows],
+        labels=[row.number for row in rows]
+    )
+    
+    texts = []
+    for i, (row, text) in enumerate(zip(rows, contents)):
+        # Create focused metadata optimized for efficient querying
+        meta = {
+            # Primary identifiers
+            'incident_id': row.number,
+            
+            # Core categorization (for filtering and grouping)
+            'category': row.category,
+            'subcategory': row.subcategory,
+            
+            # Priority and impact (for severity-based queries)
+            'priority_level': row.priority_level,  # Just the number
+            'severity': row.severity,
+            
+            # Operational status
+            'state': row.state,
+            'team': row.assignment_group,
+            
+            # Temporal attributes (for time-based queries)
+            'timestamp': timestamps[i],  # Unix timestamp for efficient range queries
+            'year_month': year_months[i],  # For monthly aggregations
+            'year': years[i],  # For yearly aggregations
+            
+            # Resolution metrics (if available)
+            'is_resolved': is_resolved[i],
+            'resolution_hours': resolution_hours[i],
+        }
+        
+        texts.append(Document(page_content=text, metadata=meta))
+    
+    return texts
+
+def incident_description(text):
+    """Summary and notes section of an incident text, which is what near-duplicate detection compares"""
+    return text.partition(DESCRIPTION_MARKER)[2] or text
+
+def incident_minhash(text):
+    """MinHash signature over word shingles of an incident text"""
+    words = text.lower().split()
+    shingles = {
+        " ".join(words[i:i + SHINGLE_SIZE])
+        for i in range(max(len(words) - SHINGLE_SIZE + 1, 1))
+    }
+    minhash = MinHash(num_perm=MINHASH_PERMUTATIONS)
+    minhash.update_batch([shingle.encode() for shingle in shingles])
+    return minhash
+
+def deduplicate_documents(documents):
+    """Group incidents by near-duplicate description, merging only those whose metadata also matches"""
+    kept = []
+    exact = {}
+    # Description group (index of its first document) -> metadata key -> kept document index
+    groups = {}
+    lsh = MinHashLSH(threshold=NEAR_DUPLICATE_THRESHOLD, num_perm=MINHASH_PERMUTATIONS)
+    
+    for doc in documents:
+        description = incident_description(doc.page_content)
+        
+        # Cheap exact check first; only new descriptions pay for MinHash
+        text_hash = xxhash.xxh64_intdigest(description)
+        group = exact.get(text_hash)
+        if group is None:
+            minhash = incident_minhash(description)
+            candidates = lsh.query(minhash)
+            if candidates:
+                group = min(candidates)
+            else:
+                group = len(kept)
+                lsh.insert(group, minhash)
+            exact[text_hash] = group
+        
+        # Merging drops the incident from counts and filters, so it needs matching metadata as well
+        metadata_key = tuple(doc.metadata[field] for field in DEDUPE_METADATA_FIELDS)
+        members = groups.setdefault(group, {})
+        merged_into = members.get(metadata_key)
+        if merged_into is not None:
+            kept[merged_into].metadata.setdefault('duplicates', []).append(doc.metadata['incident_id'])
+            continue
+        
+        members[metadata_key] = len(kept)
+        kept.append(doc)
+    
+    if len(kept) < len(documents):
+        logger.info(f"Merged {len(documents) - len(kept)} duplicate incidents before embedding")
+    return kept